@@ -2,7 +2,7 @@ import pandapower.networks as pn
 import pandas as pd
 import numpy as np
 
-def setup_research_data():
+def setup_research_data(seed=42):
     # 1. Load the Grid
     net = pn.case118()
     print(f"Successfully loaded IEEE 118-bus system with {len(net.bus)} buses.")
@@ -13,12 +13,13 @@ def setup_research_data():
     base_wind_power = 100.0  # MW
     uncertainty = 0.2  # 20% variability
     
-    # Generate Weibull-distributed wind profile
-    wind_profile = base_wind_power * np.random.weibull(a=2, size=time_steps) * (1 + uncertainty)
+    # Generate Weibull-distributed wind profile (seeded for reproducible runs)
+    rng = np.random.default_rng(seed)
+    wind_profile = (base_wind_power * rng.weibull(a=2.0, size=time_steps) * (1 + uncertainty)).astype(np.float32)
     
     # 3. Create a Dataframe to store results
     res_data = pd.DataFrame({
-        'Hour': range(time_steps),
+        'Hour': np.arange(time_steps, dtype=np.int16),
         'Wind_MW': wind_profile
     })
     
@@ -26,5 +27,5 @@ def setup_research_data():
 
 # Run setup
 grid, renewable_data = setup_research_data()
-renewable_data.to_csv("renewable_penetration_profile.csv", index=False)
+renewable_data.to_csv("renewable_penetration_profile.csv", index=False, float_format='%.4f')
 print("Data initialization complete. Profiles saved to 'renewable_penetration_profile.csv'.")
\ No newline at end of file
@@ -1,40 +1,144 @@
+import copy
+import multiprocessing
+
 import pandapower as pp
 import pandapower.networks as nw
 import numpy as np
 import pennylane as qml
-from pennylane import numpy as pnp
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import lightsim2grid  # noqa: F401  (C++ Newton-Raphson backend for pandapower)
+    LIGHTSIM2GRID_AVAILABLE = True
+except ImportError:
+    LIGHTSIM2GRID_AVAILABLE = False
 
 # ==========================================
 # 1. SMART GRID ENVIRONMENT (IEEE 118-BUS)
 # ==========================================
 class SmartGridEnv:
-    def __init__(self):
-        # Load IEEE 118-bus system
-        self.net = nw.case118()
-        # Add Renewable Integration at Bus 10
-        pp.create_sgen(self.net, 10, p_mw=50, q_mvar=10, name="Wind Farm")
+    def __init__(self, net=None):
+        if net is None:
+            # Load IEEE 118-bus system
+            net = nw.case118()
+            # Add Renewable Integration at Bus 10
+            pp.create_sgen(net, 10, p_mw=50, q_mvar=10, name="Wind Farm")
+        self.net = net
+        # Reused output buffer for get_state (6 loadings + 6 voltages)
+        self._state_buf = np.empty(12)
+        # Scratch buffers for the get_reward reductions
+        self._cong_buf = np.empty(len(self.net.line))
+        self._vdev_buf = np.empty(len(self.net.bus))
+        # Whether the result tables match the current set-points
+        self._solved = False
+        # Baseline dispatch: every action is applied relative to this snapshot
+        self._p_mw0 = self.net.gen.p_mw.values.copy()
+        # View of the gen p_mw column; set-points are written through it. Under
+        # pandas copy-on-write .values is read-only, so fall back to assignment.
+        gen_p_mw = self.net.gen["p_mw"].values
+        usable = gen_p_mw.flags.writeable and np.shares_memory(gen_p_mw, self.net.gen["p_mw"].values)
+        self._gen_p_mw = gen_p_mw if usable else None
+        # Default power flow options: applied to every pp.runpp(self.net)
+        pp.set_user_pf_options(self.net, numba=True, lightsim2grid=LIGHTSIM2GRID_AVAILABLE,
+                               init="results", v_debug=False, tolerance_mva=1e-6)
+        # Only gen set-points change between solves, so the ppc and Ybus built
+        # by an AC solve are reused (topology changes would invalidate them)
+        self._recycle = dict(bus_pq=True, gen=True, trafo=False, bfsw=False,
+                             _is_elements=False, ppc=True, Ybus=True)
+        self._ppc_is_ac = False
+        # Initial solve so later calls can warm-start from res_bus
+        if self.net.res_bus.empty:
+            self._runpp()
+            self._solved = True
         
     def get_state(self):
-        # State: Line loadings and bus voltages
-        pp.runpp(self.net)
-        loading = self.net.res_line.loading_percent.values / 100.0 # Normalized
-        voltages = self.net.res_bus.vm_pu.values
+        # State: Line loadings and bus voltages (reuses the last AC solve)
+        if not self._solved:
+            self._runpp()
+            self._solved = True
         # Return a subset of critical features (first 12 for 12 qubits)
-        return np.concatenate([loading[:6], voltages[:6]])
+        self._state_buf[:6] = self.net.res_line.loading_percent.values[:6] * 0.01 # Normalized
+        self._state_buf[6:] = self.net.res_bus.vm_pu.values[:6]
+        return self._state_buf
 
     def apply_action(self, gen_adjustments):
-        # Adjust generator outputs based on QPSO/VQRL decision
-        for i, adj in enumerate(gen_adjustments[:54]):
-            self.net.gen.at[i, 'p_mw'] += adj
-        pp.runpp(self.net)
+        # Adjust generator outputs relative to the baseline dispatch
+        # (vectorized; case118 has fewer gens than the 54-dim action).
+        # float32 QPSO particles are upcast to float64 when written.
+        self._write_p_mw(gen_adjustments[:len(self._p_mw0)])
+        self._runpp()
+        self._solved = True
+
+    def _write_p_mw(self, adjustments):
+        # gen.p_mw = baseline + adjustments, in place when the view is usable
+        if self._gen_p_mw is not None:
+            np.add(self._p_mw0, adjustments, out=self._gen_p_mw)
+        else:
+            self.net.gen["p_mw"] = self._p_mw0 + adjustments
+        self._solved = False
+        
+    def _runpp(self):
+        # AC solve warm-started from the last results (init="results"); recycles
+        # the internal matrices unless a failed solve replaced them
+        try:
+            pp.runpp(self.net, recycle=self._recycle if self._ppc_is_ac else None)
+        except pp.powerflow.LoadflowNotConverged:
+            # Diverged from the warm start: retry from a flat start on freshly
+            # built matrices (the failed run may have left a bad ppc behind)
+            self._drop_ppc()
+            try:
+                pp.runpp(self.net, init="flat")
+            except pp.powerflow.LoadflowNotConverged:
+                self._drop_ppc()
+                raise
+        self._ppc_is_ac = True
+
+    def _drop_ppc(self):
+        # Never recycle the internal matrices of a failed solve
+        self._ppc_is_ac = False
+        self.net._ppc = None
         
     def get_reward(self):
         # Reward = Negative of (Congestion + Voltage Deviation)
-        pp.runpp(self.net)
-        congestion = np.sum(np.maximum(0, self.net.res_line.loading_percent - 100))
-        v_dev = np.sum(np.abs(self.net.res_bus.vm_pu - 1.0))
+        # Reads the results of the last solve in apply_action
+        assert self._solved, "get_reward called before solving the current set-points"
+        np.subtract(self.net.res_line.loading_percent.values, 100.0, out=self._cong_buf)
+        congestion = np.clip(self._cong_buf, 0, None, out=self._cong_buf).sum()
+        np.subtract(self.net.res_bus.vm_pu.values, 1.0, out=self._vdev_buf)
+        v_dev = np.abs(self._vdev_buf, out=self._vdev_buf).sum()
         return -(0.7 * congestion + 0.3 * v_dev)
 
+    def evaluate(self, gen_adjustments):
+        # One power flow solve per candidate action
+        self.apply_action(gen_adjustments)
+        return self.get_reward()
+
+    def action_bounds(self, n_dimensions):
+        # Per-dimension adjustment limits from the gen table's min/max p_mw;
+        # dimensions beyond the gen count are held at 0
+        lower = np.zeros(n_dimensions, dtype=np.float32)
+        upper = np.zeros(n_dimensions, dtype=np.float32)
+        n_gen = min(n_dimensions, len(self._p_mw0))
+        lower[:n_gen] = (self.net.gen.min_p_mw.fillna(-np.inf).values - self._p_mw0)[:n_gen]
+        upper[:n_gen] = (self.net.gen.max_p_mw.fillna(np.inf).values - self._p_mw0)[:n_gen]
+        return lower, upper
+
+    def reset(self):
+        # Back to the baseline dispatch (results refresh on the next solve)
+        self._write_p_mw(0.0)
+
+    def to_json(self):
+        # Serialize a copy of the grid at its baseline dispatch for worker
+        # processes; this env's dispatch and results are left untouched
+        net = copy.deepcopy(self.net)
+        net.gen["p_mw"] = self._p_mw0
+        return pp.to_json(net)
+
 # ==========================================
 # 2. VQRL AGENT (Quantum Circuit)
 # ==========================================
@@ -42,10 +146,10 @@ n_qubits = 12
 dev = qml.device("default.qubit", wires=n_qubits)
 
 @qml.qnode(dev)
-def vqc_policy(weights, state):
-    # 1. Angle Encoding of Grid State
+def vqc_policy(weights, angles):
+    # 1. Angle Encoding of Grid State (angles = state * pi)
     for i in range(n_qubits):
-        qml.RY(state[i] * np.pi, wires=i)
+        qml.RY(angles[i], wires=i)
     
     # 2. Entangling Layers (Ladder Topology)
     for i in range(n_qubits - 1):
@@ -58,75 +162,231 @@ def vqc_policy(weights, state):
     # 4. Measurement (Expectation Values)
     return [qml.expval(qml.PauliZ(i)) for i in range(n_qubits)]
 
+def _ladder_z_support(n_wires):
+    # Heisenberg picture: conjugate each Z_k back through the CNOT ladder.
+    # CNOT(c, t) maps Z_t -> Z_c Z_t and leaves Z_c alone. Bit j of
+    # support[k] is set when Z_j appears in the resulting Pauli string.
+    support = [1 << k for k in range(n_wires)]
+    for k in range(n_wires):
+        for c in reversed(range(n_wires - 1)):
+            if support[k] >> (c + 1) & 1:
+                support[k] ^= 1 << c
+    return np.array([[m >> j & 1 for j in range(n_wires)] for m in support], dtype=bool)
+
+_Z_SUPPORT = _ladder_z_support(n_qubits)
+
+def vqc_policy_fast(weights, angles):
+    # Closed-form <Z_i> of vqc_policy without building the statevector.
+    # RY(theta)|0> gives <Z> = cos(theta) on a product state, and RZ commutes
+    # with Z, so the variational weights do not affect the readout.
+    z = np.cos(angles)
+    return np.prod(np.where(_Z_SUPPORT, z, 1.0), axis=1)
+
 # ==========================================
 # 3. QUANTUM-BEHAVED PSO (QPSO)
 # ==========================================
+def _qpso_step_loops(particles, pbest, gbest, mbest, beta, rand, out):
+    # Quantum Position Update (Delta Potential Well), compiled with numba.
+    # rand holds (u, phi, sign source) uniforms of shape (3, P, D).
+    n_particles, n_dimensions = particles.shape
+    for i in range(n_particles):
+        for j in range(n_dimensions):
+            phi = rand[1, i, j]
+            # Local Attractor
+            p = phi * pbest[i, j] + (1.0 - phi) * gbest[j]
+            sign = 1.0 if rand[2, i, j] > 0.5 else -1.0
+            # -log(1 - u) with u in [0, 1): same law as log(1/u), never infinite
+            out[i, j] = p - sign * beta * abs(mbest[j] - particles[i, j]) * np.log1p(-rand[0, i, j])
+    return out
+
+def _qpso_step_numpy(particles, pbest, gbest, mbest, beta, rand, out):
+    # Same update as _qpso_step_loops, broadcast over all particles
+    phi = rand[1]
+    p = phi * pbest + (1 - phi) * gbest
+    sign = np.where(rand[2] > 0.5, 1.0, -1.0)
+    out[:] = p - sign * beta * np.abs(mbest - particles) * np.log1p(-rand[0])
+    return out
+
+# Single-threaded on purpose: a 20x54 update is too small for threads
+_qpso_step = (njit(fastmath=True, cache=True)(_qpso_step_loops) if NUMBA_AVAILABLE
+              else _qpso_step_numpy)
+
+_worker_env = None
+
+def _init_worker(net_json):
+    # Pool initializer: each worker builds its grid once from the snapshot.
+    # Actions are relative to the baseline dispatch, so it never goes stale.
+    global _worker_env
+    _worker_env = SmartGridEnv(pp.from_json_string(net_json))
+
+def _fitness(env, adjustments):
+    # A particle whose power flow does not converge is infeasible, not fatal
+    try:
+        return -env.evaluate(adjustments)
+    except pp.powerflow.LoadflowNotConverged:
+        return np.inf
+
+def _evaluate_particle(adjustments):
+    return _fitness(_worker_env, adjustments)
+
 class QPSO:
-    def __init__(self, n_particles, n_dimensions, beta):
+    def __init__(self, n_particles, n_dimensions, beta, bounds, n_processes=0, seed=None):
         self.n_particles = n_particles
         self.n_dimensions = n_dimensions
         self.beta = beta # Contraction-expansion coefficient
-        self.particles = np.random.uniform(-1, 1, (n_particles, n_dimensions))
+        # n_processes=0 (default) evaluates particles serially in this process;
+        # otherwise a worker pool (None: one per core) is started on the first
+        # update and reused across updates
+        self.n_processes = n_processes
+        self.pool = None
+        self._pool_env = None
+        # (lower, upper) per-dimension limits, see SmartGridEnv.action_bounds
+        self.lower, self.upper = bounds
+        self._rng = np.random.default_rng(seed)
+        # float32 throughout: the search is stochastic and set-points are in MW
+        self.particles = self._rng.uniform(-1, 1, (n_particles, n_dimensions)).astype(np.float32)
+        self._clip()
         self.pbest = self.particles.copy()
+        self.pbest_fit = np.full(n_particles, np.inf)
+        # Output buffer for _qpso_step, swapped with particles every update
+        self._next_particles = np.empty_like(self.particles)
         self.gbest = self.particles[0].copy()
         self.gbest_fit = float('inf')
 
     def update(self, env):
         mbest = np.mean(self.pbest, axis=0)
         
-        for i in range(self.n_particles):
-            # Quantum Position Update (Delta Potential Well)
-            u = np.random.random(self.n_dimensions)
-            phi = np.random.random(self.n_dimensions)
-            
-            # Local Attractor
-            p = phi * self.pbest[i] + (1 - phi) * self.gbest
-            
-            # Update Position
-            sign = np.where(np.random.random(self.n_dimensions) > 0.5, 1, -1)
-            self.particles[i] = p + sign * self.beta * np.abs(mbest - self.particles[i]) * np.log(1/u)
-            
-            # Evaluate Fitness (Smart Grid Response)
-            env.apply_action(self.particles[i])
-            fit = -env.get_reward()
-            
-            if fit < self.gbest_fit:
-                self.gbest = self.particles[i].copy()
-                self.gbest_fit = fit
+        # One contiguous draw per update; float32 is ample for the PSO step
+        rand = self._rng.random((3, self.n_particles, self.n_dimensions), dtype=np.float32)
+        _qpso_step(self.particles, self.pbest, self.gbest, mbest, self.beta, rand,
+                   self._next_particles)
+        self.particles, self._next_particles = self._next_particles, self.particles
+        self._clip()
+        
+        # Evaluate Fitness (Smart Grid Response)
+        if self.n_processes == 0:
+            fits = [_fitness(env, x) for x in self.particles]
+        else:
+            # One chunk per worker: each task pickles only its particles
+            n_workers = self.n_processes or multiprocessing.cpu_count()
+            chunksize = -(-self.n_particles // n_workers)
+            fits = self._get_pool(env).map(_evaluate_particle, self.particles, chunksize=chunksize)
+        fits = np.asarray(fits)
+        
+        improved = fits < self.pbest_fit
+        self.pbest[improved] = self.particles[improved]
+        self.pbest_fit[improved] = fits[improved]
+        
+        i = np.argmin(fits)
+        if fits[i] < self.gbest_fit:
+            self.gbest = self.particles[i].copy()
+            self.gbest_fit = fits[i]
         return self.gbest
 
+    def set_beta(self, beta):
+        self.beta = beta
+
+    def perturb(self, scale=0.05):
+        # Gaussian kick between epochs to escape stagnation; pbest/gbest are kept
+        self.particles += scale * self._rng.standard_normal(self.particles.shape, dtype=np.float32)
+        self._clip()
+
+    def _clip(self):
+        # Keep every adjustment inside the generators' operating limits
+        np.clip(self.particles, self.lower, self.upper, out=self.particles)
+
+    def _get_pool(self, env):
+        # The grid snapshot is sent once, to the pool initializer
+        if self._pool_env is not env:
+            self.close()
+            self.pool = multiprocessing.Pool(self.n_processes, initializer=_init_worker,
+                                             initargs=(env.to_json(),))
+            self._pool_env = env
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self._pool_env = None
+
 # ==========================================
 # 4. MAIN HYBRID TRAINING LOOP
 # ==========================================
-def main():
+def main(debug=False, n_processes=None):
     env = SmartGridEnv()
-    weights = pnp.random.random(n_qubits, requires_grad=True)
+    # Plain NumPy: the heuristic update below never differentiates the weights
+    weights = np.random.random(n_qubits)
+    
+    # One swarm for the whole run; beta is re-tuned by the agent every epoch.
+    # Particle fitness runs on a worker pool (None: one per core, 0: serial).
+    optimizer = QPSO(n_particles=20, n_dimensions=54, beta=1.0, bounds=env.action_bounds(54),
+                     n_processes=n_processes)
     
     print("Starting VQRL-QPSO Congestion Management...")
     
-    for epoch in range(50):
-        # 1. Observe Grid
-        state = env.get_state()
-        
-        # 2. Quantum Agent Decision (VQC Output)
-        quantum_outputs = vqc_policy(weights, state)
-        
-        # Use quantum output to tune QPSO Beta (Adaptive control)
-        adaptive_beta = 0.5 + 0.5 * np.mean(quantum_outputs)
-        
-        # 3. Optimization via QPSO
-        optimizer = QPSO(n_particles=20, n_dimensions=54, beta=adaptive_beta)
-        best_rescheduling = optimizer.update(env)
-        
-        # 4. Verify Congestion Relief
-        env.apply_action(best_rescheduling)
-        final_reward = env.get_reward()
-        
-        print(f"Epoch {epoch} | Beta: {adaptive_beta:.4f} | Reward: {final_reward:.4f}")
-        
-        # 5. Policy Update (Simplification of Parameter Shift rule)
-        # In full implementation, use opt = qml.GradientDescentOptimizer()
-        weights = weights + 0.01 * final_reward # Heuristic update for demo
+    try:
+        for epoch in range(50):
+            # 1. Observe Grid
+            state = env.get_state()
+            angles = state * np.pi
+            
+            # 2. Quantum Agent Decision (VQC Output)
+            quantum_outputs = vqc_policy_fast(weights, angles)
+            if debug:
+                assert np.allclose(quantum_outputs, vqc_policy(weights, angles))
+            
+            # Use quantum output to tune QPSO Beta (Adaptive control)
+            adaptive_beta = 0.5 + 0.5 * np.mean(quantum_outputs)
+            
+            # 3. Optimization via QPSO
+            optimizer.set_beta(adaptive_beta)
+            best_rescheduling = optimizer.update(env)
+            
+            # 4. Verify Congestion Relief
+            final_reward = env.evaluate(best_rescheduling)
+            
+            print(f"Epoch {epoch} | Beta: {adaptive_beta:.4f} | Reward: {final_reward:.4f}")
+            
+            # 5. Policy Update (Simplification of Parameter Shift rule)
+            # In full implementation, use opt = qml.GradientDescentOptimizer() and
+            # wrap only inside the gradient call, e.g. with pennylane.numpy as pnp:
+            # qml.grad(lambda w: cost(vqc_policy(w, angles)))(pnp.array(weights, requires_grad=True))
+            weights = weights + 0.01 * final_reward # Heuristic update for demo
+            
+            optimizer.perturb()
+    finally:
+        optimizer.close()
+
+# ==========================================
+# 5. INDEPENDENT EPOCHS (PARAMETER SWEEPS)
+# ==========================================
+_epoch_env = None
+
+def run_epoch(weights, seed):
+    # One observe / decide / optimize / verify pass from the base grid.
+    # Each sweep worker builds its SmartGridEnv once and reuses it.
+    global _epoch_env
+    if _epoch_env is None:
+        _epoch_env = SmartGridEnv()
+    env = _epoch_env
+    env.reset()
+    
+    angles = env.get_state() * np.pi
+    adaptive_beta = 0.5 + 0.5 * np.mean(vqc_policy_fast(weights, angles))
+    
+    # Sweep workers are already parallel: evaluate particles in-process
+    optimizer = QPSO(n_particles=20, n_dimensions=54, beta=adaptive_beta,
+                     bounds=env.action_bounds(54), seed=seed)
+    gbest = optimizer.update(env)
+    return env.evaluate(gbest), gbest
+
+def run_sweep(weights, seeds=range(50), n_jobs=-1):
+    # Replays independent epochs across processes; returns [(reward, gbest)]
+    from joblib import Parallel, delayed
+    return Parallel(n_jobs=n_jobs, backend="loky")(
+        delayed(run_epoch)(weights, seed) for seed in seeds)
 
 if __name__ == "__main__":
     main()